@@ -0,0 +1,270 @@
+import asyncio
+import cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from trackers import FaceTracker
+
+
+class _ExecutorStage(object):
+    """A stage whose blocking work runs on an executor.
+
+    If no executor is given, the stage creates and owns a
+    single-thread executor, which keeps calls on a stateful OpenCV
+    object (a capture, a classifier, a writer) on one thread.
+    """
+
+    def __init__(self, executor=None, threadNamePrefix='stage'):
+        self._ownsExecutor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                1, thread_name_prefix=threadNamePrefix)
+        self._executor = executor
+
+    def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, func, *args)
+
+    def _shutdownExecutor(self):
+        if self._ownsExecutor:
+            self._executor.shutdown(wait=False)
+
+
+class AsyncCaptureManager(_ExecutorStage):
+    """An async iterator of frames from a capture.
+
+    Frames are read on the capture's own thread. At most maxInFlight
+    frames are read but not yet taken by the consumer. When the
+    consumer falls behind, reading waits rather than buffering more
+    frames.
+
+        async with AsyncCaptureManager(cv2.VideoCapture(0)) as capture:
+            async for frame in capture:
+                ...
+    """
+
+    def __init__(self, capture, maxInFlight=2, shouldMirror=False,
+                 executor=None):
+        _ExecutorStage.__init__(self, executor, 'capture')
+        self.shouldMirror = shouldMirror
+        self._capture = capture
+        self._maxInFlight = max(1, maxInFlight)
+        self._frames = None
+        self._frameSlots = None
+        self._readTask = None
+        self._readError = None
+        self._isExhausted = False
+        self._framesElapsed = 0
+
+    @property
+    def framesElapsed(self):
+        return self._framesElapsed
+
+    def __aiter__(self):
+        if self._readTask is None and not self._isExhausted:
+            self._frames = asyncio.Queue()
+            self._frameSlots = asyncio.Semaphore(self._maxInFlight)
+            self._readTask = asyncio.ensure_future(self._readFrames())
+        return self
+
+    async def __anext__(self):
+        if self._isExhausted:
+            raise StopAsyncIteration
+        if self._readTask is None:
+            self.__aiter__()
+        frame = await self._frames.get()
+        if frame is None:
+            self._isExhausted = True
+            if self._readError is not None:
+                readError = self._readError
+                self._readError = None
+                raise readError
+            raise StopAsyncIteration
+        # The frame is the consumer's now, so another may be read.
+        self._frameSlots.release()
+        self._framesElapsed += 1
+        return frame
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excInfo):
+        await self.aclose()
+
+    async def aclose(self):
+        """Stop reading frames and release the capture."""
+        if self._readTask is not None:
+            self._readTask.cancel()
+            try:
+                await self._readTask
+            except asyncio.CancelledError:
+                pass
+            self._readTask = None
+        if self._capture is not None:
+            await self._run(self._capture.release)
+            self._capture = None
+        self._shutdownExecutor()
+
+    def _readFrame(self):
+        ok, frame = self._capture.read()
+        if not ok:
+            return None
+        if self.shouldMirror:
+            frame = cv2.flip(frame, 1)
+        return frame
+
+    async def _readFrames(self):
+        try:
+            while True:
+                await self._frameSlots.acquire()
+                frame = await self._run(self._readFrame)
+                self._frames.put_nowait(frame)
+                if frame is None:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Hand the error to the consumer rather than hang it.
+            self._readError = e
+            self._frames.put_nowait(None)
+
+
+class AsyncFaceTracker(_ExecutorStage):
+    """An awaitable wrapper of a FaceTracker.
+
+    Updates are serialized, even on a shared multi-thread executor,
+    and each returns the faces found in its own image.
+    """
+
+    def __init__(self, faceTracker=None, executor=None):
+        _ExecutorStage.__init__(self, executor, 'tracker')
+        if faceTracker is None:
+            faceTracker = FaceTracker()
+        self._faceTracker = faceTracker
+        self._updateLock = threading.Lock()
+
+    @property
+    def faces(self):
+        """The tracked facial features"""
+        return self._faceTracker.faces
+
+    async def update(self, image):
+        """Update the tracked facial features and return them."""
+        return await self._run(self._update, image)
+
+    def _update(self, image):
+        with self._updateLock:
+            self._faceTracker.update(image)
+            return self._faceTracker.faces
+
+    def close(self):
+        self._shutdownExecutor()
+
+
+class AsyncFilter(_ExecutorStage):
+    """An awaitable wrapper of a (src, dst) filter function.
+
+    Filters are stateless, so one thread pool can be shared by many
+    AsyncFilters.
+    """
+
+    def __init__(self, filterFunc, executor=None):
+        _ExecutorStage.__init__(self, executor, 'filter')
+        self._filterFunc = filterFunc
+
+    async def apply(self, src, dst):
+        """Apply the filter on the executor."""
+        await self._run(self._filterFunc, src, dst)
+
+    def close(self):
+        self._shutdownExecutor()
+
+
+class AsyncVideoWriter(_ExecutorStage):
+    """A video file writer that writes frames on its own thread.
+
+    At most maxPending frames wait to be written; beyond that, write()
+    waits for the writer to catch up. The file is opened on the
+    writer's thread, on entering an async with block or on the first
+    write().
+    """
+
+    def __init__(self, filename, fps, size,
+                 encoding=cv2.VideoWriter_fourcc('I', '4', '2', '0'),
+                 maxPending=4, executor=None):
+        _ExecutorStage.__init__(self, executor, 'writer')
+        self._videoWriterArgs = (filename, encoding, fps, size)
+        self._videoWriter = None
+        self._frames = asyncio.Queue(max(1, maxPending))
+        self._writeTask = None
+        self._framesWritten = 0
+
+    @property
+    def framesWritten(self):
+        return self._framesWritten
+
+    async def write(self, frame):
+        """Queue a frame to be written.
+
+        The writer keeps a reference to the frame until it is written,
+        so the caller should not modify it afterwards.
+        """
+        self._startWriting()
+        await self._put(frame)
+
+    async def __aenter__(self):
+        self._startWriting()
+        return self
+
+    async def __aexit__(self, *excInfo):
+        await self.aclose()
+
+    async def aclose(self):
+        """Write any queued frames, then release the file."""
+        try:
+            if self._writeTask is not None:
+                if not self._writeTask.done():
+                    await self._put(None)
+                await self._writeTask
+        finally:
+            self._writeTask = None
+            if self._videoWriter is not None:
+                await self._run(self._videoWriter.release)
+                self._videoWriter = None
+            self._shutdownExecutor()
+
+    async def _put(self, item):
+        """Queue an item for the writer task.
+
+        If the writer task stops (e.g. because a write failed) while
+        the queue is full, raise its error rather than wait forever.
+        """
+        if self._writeTask.done():
+            self._raiseWriteError()
+        put = asyncio.ensure_future(self._frames.put(item))
+        try:
+            await asyncio.wait([put, self._writeTask],
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if not put.done() or put.cancelled():
+            self._raiseWriteError()
+
+    def _raiseWriteError(self):
+        # Re-raise the writer task's error, if any.
+        self._writeTask.result()
+        raise RuntimeError('the video writer is closed')
+
+    def _startWriting(self):
+        if self._writeTask is None:
+            self._writeTask = asyncio.ensure_future(self._writeFrames())
+
+    async def _writeFrames(self):
+        self._videoWriter = await self._run(cv2.VideoWriter,
+                                            *self._videoWriterArgs)
+        while True:
+            frame = await self._frames.get()
+            if frame is None:
+                return
+            await self._run(self._videoWriter.write, frame)
+            self._framesWritten += 1
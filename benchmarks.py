@@ -0,0 +1,115 @@
+import sys
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import filters
+
+
+def legacyRecolorRC(src, dst):
+    """recolorRC as it was before the single-pass rewrite."""
+    b, g, r = cv2.split(src)
+    cv2.addWeighted(b, 0.5, g, 0.5, 0, b)
+    cv2.merge((b, b, r), dst)
+
+
+def legacyRecolorRGV(src, dst):
+    """recolorRGV as it was before the single-pass rewrite.
+
+    Note that cv2.min(b, g, r) overwrites the red plane.
+    """
+    b, g, r = cv2.split(src)
+    cv2.min(b, g, r)
+    cv2.min(b, r, b)
+    cv2.merge((b, g, r), dst)
+
+
+def legacyRecolorCMV(src, dst):
+    """recolorCMV as it was before the single-pass rewrite."""
+    b, g, r = cv2.split(src)
+    cv2.max(b, g, b)
+    cv2.max(b, r, b)
+    cv2.merge((b, g, r), dst)
+
+
+def timeFilter(func, src, dst, number):
+    """Return the mean time in ms of a (src, dst) filter call."""
+    func(src, dst)
+    return 1000.0 * timeit.timeit(lambda: func(src, dst),
+                                  number=number) / number
+
+
+def benchRecolor(width=640, height=480, number=50, repeat=5):
+    """Compare the legacy and current recolor functions.
+
+    Each case gets its own src and dst, so no case runs on images that
+    an earlier case left in cache. The cases are timed in turn, repeat
+    times over, and the best mean of each is reported, so that none of
+    them is favored by running first or last.
+    """
+    image = np.random.randint(0, 256, (height, width, 3), np.uint8)
+    pairs = [('recolorRC', legacyRecolorRC, filters.recolorRC),
+             ('recolorRGV', legacyRecolorRGV, filters.recolorRGV),
+             ('recolorCMV', legacyRecolorCMV, filters.recolorCMV)]
+    cases = []
+    for name, legacy, current in pairs:
+        for func, inPlace in ((legacy, False), (current, False),
+                              (current, True)):
+            src = image.copy()
+            dst = src if inPlace else np.empty_like(src)
+            cases.append((name, func, src, dst, []))
+    for i in range(repeat):
+        for name, func, src, dst, times in cases:
+            times.append(timeFilter(func, src, dst, number))
+
+    print('%dx%d, best of %d x %d runs, mean ms per frame' % (
+        width, height, repeat, number))
+    print('%-12s %10s %10s %10s' % ('', 'legacy', 'current',
+                                     'in place'))
+    for i, (name, legacy, current) in enumerate(pairs):
+        bestTimes = [min(times) for name, func, src, dst, times
+                     in cases[3 * i:3 * i + 3]]
+        print('%-12s %10.3f %10.3f %10.3f' % tuple([name] + bestTimes))
+
+
+def benchBatch(numFrames=64, width=640, height=480, number=5):
+    src = np.random.randint(0, 256, (numFrames, height, width, 3),
+                            np.uint8)
+    dst = np.empty_like(src)
+    curveFilter = filters.BGRPortraCurveFilter()
+    sharperFilter = filters.SharperFilter()
+    executor = ThreadPoolExecutor(4)
+    cases = [('BGRPortra', curveFilter.apply, curveFilter.applyBatch),
+             ('Sharper', sharperFilter.apply, sharperFilter.applyBatch),
+             ('recolorRC', filters.recolorRC,
+              lambda s, d, **kw: filters.applyBatch(
+                  filters.recolorRC, s, d, isPointwise=True, **kw)),
+             ('strokeEdges', filters.strokeEdges,
+              lambda s, d, **kw: filters.applyBatch(
+                  filters.strokeEdges, s, d, **kw))]
+
+    def perFrame(apply):
+        for i in range(numFrames):
+            apply(src[i], dst[i])
+
+    print('%d frames of %dx%d, %d runs, mean ms per stack' % (
+        numFrames, width, height, number))
+    print('%-12s %10s %10s %10s' % ('', 'per frame', 'batch',
+                                     '4 threads'))
+    for name, apply, applyBatch in cases:
+        print('%-12s %10.1f %10.1f %10.1f' % (
+            name,
+            1000.0 * timeit.timeit(lambda: perFrame(apply),
+                                   number=number) / number,
+            1000.0 * timeit.timeit(lambda: applyBatch(src, dst),
+                                   number=number) / number,
+            1000.0 * timeit.timeit(
+                lambda: applyBatch(src, dst, executor=executor),
+                number=number) / number))
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    benchRecolor()
+    benchBatch()
+    sys.exit()
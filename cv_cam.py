@@ -1,47 +1,83 @@
 import cv2
 import sys
 import filters
-from managers import WindowManager, CaptureManager
+from managers import WindowManager, CaptureManager, StreamManager
 import rects
 from trackers import FaceTracker
+from profiling import AllocationProfiler
 import depth
 
 
 class CVcam(object):
 
-    def __init__(self):
-        self._windowManager = WindowManager('CVcam',
-                                            self.onKeypress)
+    def __init__(self, shouldStream=False):
+        if shouldStream:
+            # Serve the feed over HTTP instead of showing a window.
+            self._windowManager = StreamManager(
+                keypressCallback=self.onKeypress)
+        else:
+            self._windowManager = WindowManager('CVcam',
+                                                self.onKeypress)
         self._captureManager = CaptureManager(cv2.VideoCapture(0),
                                               self._windowManager,
                                               True)
         self._faceTracker = FaceTracker()
         self._shouldDrawDebugRects = False
         self._showEdgeFilter = False
+        self._filterFacesOnly = True
+        self._allocationProfiler = AllocationProfiler()
         self._curveFilter = filters.BGRPortraCurveFilter()
 
+    def _strokeAndCurve(self, src, dst):
+        filters.strokeEdges(src, dst)
+        self._curveFilter.apply(dst, dst)
+
+    def _applyEdgeFilter(self, frame, faces):
+        """Apply the edge and curve filters to the faces or whole frame."""
+        if self._filterFacesOnly:
+            filters.applyToRects(self._strokeAndCurve, frame, frame,
+                                 [face.faceRect for face in faces],
+                                 featherSize=8)
+        else:
+            self._strokeAndCurve(frame, frame)
+
     def run(self):
         """Run the main loop"""
         self._windowManager.createWindow()
-        while self._windowManager.isWindowCreated:
-            self._captureManager.enterFrame()
-            frame = self._captureManager.frame
-
-            # TODO: Track faces
-            self._faceTracker.update(frame)
-            faces = self._faceTracker.faces
-            rects.swapRects(frame, frame,
-                            [face.faceRect for face in faces])
-
-            if self._showEdgeFilter:
-                filters.strokeEdges(frame, frame)
-                self._curveFilter.apply(frame, frame)
-
-            if self._shouldDrawDebugRects:
-                self._faceTracker.drawDebugRects(frame)
-
-            self._captureManager.exitFrame()
-            self._windowManager.processEvents()
+        profiler = self._allocationProfiler
+        try:
+            while self._windowManager.isWindowCreated:
+                with profiler.stage('capture'):
+                    self._captureManager.enterFrame()
+                    frame = self._captureManager.frame
+
+                # TODO: Track faces
+                with profiler.stage('track'):
+                    self._faceTracker.update(frame)
+                    faces = self._faceTracker.faces
+                with profiler.stage('swap'):
+                    rects.swapRects(frame, frame,
+                                    [face.faceRect for face in faces])
+
+                if self._showEdgeFilter:
+                    with profiler.stage('filter'):
+                        self._applyEdgeFilter(frame, faces)
+
+                if self._shouldDrawDebugRects:
+                    self._faceTracker.drawDebugRects(frame)
+
+                with profiler.stage('exit'):
+                    self._captureManager.exitFrame()
+                profiler.endFrame()
+                self._windowManager.processEvents()
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        """Close the window or stream and release the capture."""
+        if self._windowManager.isWindowCreated:
+            self._windowManager.destroyWindow()
+        self._captureManager.release()
 
     def onKeypress(self, keycode):
         """ Handle a keypress.
@@ -49,7 +85,10 @@ class CVcam(object):
         space -> Take a screenshot.
         tab -> Start/stop recording a screencast.
         x -> Start/stop drawing debug rectangles around faces.
-        e -> Apply the sketchy edge filter
+        e -> Apply the sketchy edge filter. By default only faces are
+             filtered, so nothing changes until a face is detected.
+        f -> Toggle filtering faces only or the whole frame.
+        p -> Start/stop profiling allocations and print a report.
         escape -> Quit.
 
         """
@@ -67,6 +106,14 @@ class CVcam(object):
             self._windowManager.destroyWindow()
         elif keycode == 101:
             self._showEdgeFilter = not self._showEdgeFilter
+        elif keycode == 102:  # f
+            self._filterFacesOnly = not self._filterFacesOnly
+        elif keycode == 112:  # p
+            if not self._allocationProfiler.isProfiling:
+                self._allocationProfiler.start()
+            else:
+                self._allocationProfiler.stop()
+                print(self._allocationProfiler.report())
 
 
 class CVdepthCam(CVcam):
@@ -81,37 +128,41 @@ class CVdepthCam(CVcam):
         self._shouldDrawDebugRects = False
         self._curveFilter = filters.BGRPortraCurveFilter()
         self._showEdgeFilter = False
+        self._filterFacesOnly = True
+        self._allocationProfiler = AllocationProfiler()
 
     def run(self):
         """Run the main loop."""
         self._windowManager.createWindow()
-        while self._windowManager.isWindowCreated:
-            self._captureManager.enterFrame()
-            self._captureManager.channel = \
-                depth.CV_CAP_OPENNI_DISPARITY_MAP
-            disparityMap = self._captureManager.frame
-            self._captureManager.channel = \
-                depth.CV_CAP_OPENNI_VALID_DEPTH_MASK
-            validDepthMask = self._captureManager.frame
-            self._captureManager.channel = \
-                depth.CV_CAP_OPENNI_BGR_IMAGE
-            frame = self._captureManager.frame
-            self._faceTracker.update(frame)
-            faces = self._faceTracker.faces
-            masks = [depth.createMedianMask(disparityMap, validDepthMask, face.faceRect)
-                     for face in faces]
-            rects.swapRects(frame, frame,
-                            [face.faceRect for face in faces], masks)
-            if self._showEdgeFilter:
-                filters.strokeEdges(frame, frame)
-                self._curveFilter.apply(frame, frame)
-            if self._shouldDrawDebugRects:
-                self._faceTracker.drawDebugRects(frame)
-            self._captureManager.exitFrame()
-            self._windowManager.processEvents()
+        try:
+            while self._windowManager.isWindowCreated:
+                self._captureManager.enterFrame()
+                self._captureManager.channel = \
+                    depth.CV_CAP_OPENNI_DISPARITY_MAP
+                disparityMap = self._captureManager.frame
+                self._captureManager.channel = \
+                    depth.CV_CAP_OPENNI_VALID_DEPTH_MASK
+                validDepthMask = self._captureManager.frame
+                self._captureManager.channel = \
+                    depth.CV_CAP_OPENNI_BGR_IMAGE
+                frame = self._captureManager.frame
+                self._faceTracker.update(frame)
+                faces = self._faceTracker.faces
+                masks = [depth.createMedianMask(disparityMap, validDepthMask, face.faceRect)
+                         for face in faces]
+                rects.swapRects(frame, frame,
+                                [face.faceRect for face in faces], masks)
+                if self._showEdgeFilter:
+                    self._applyEdgeFilter(frame, faces)
+                if self._shouldDrawDebugRects:
+                    self._faceTracker.drawDebugRects(frame)
+                self._captureManager.exitFrame()
+                self._windowManager.processEvents()
+        finally:
+            self._shutdown()
 
 
 if __name__ == "__main__":
-    CVcam().run()
+    CVcam(shouldStream='--stream' in sys.argv).run()
     # CVdepthCam().run()
     sys.exit()
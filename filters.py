@@ -1,8 +1,29 @@
 import cv2
+import functools
+import itertools
 import numpy as np
+import threading
+import rects
 import utils
 
 
+_RC_MATRIX = np.array([[0.5, 0.5, 0.0],
+                       [0.5, 0.5, 0.0],
+                       [0.0, 0.0, 1.0]], np.float32)
+
+
+def pointwise(filterFunc):
+    """Mark a (src, dst) filter as pointwise.
+
+    Each output pixel of a pointwise filter depends only on the same
+    input pixel, which lets applyBatch filter a stack of frames as one
+    tall frame.
+    """
+    filterFunc.isPointwise = True
+    return filterFunc
+
+
+@pointwise
 def recolorRC(src, dst):
     """Simulate conversion from BGR to RC (red, cyan).
     The source and destination images must both be in BGR format.
@@ -12,12 +33,48 @@ def recolorRC(src, dst):
     dst.b = dst.g = 0.5 * (src.b + src.g)
     dst.r = src.r
 
+    The destination may be the source.
+    """
+    cv2.transform(src, _RC_MATRIX, dst)
+
+
+_CHANNEL_KERNEL = np.ones((1, 3), np.uint8)
+_scratch = threading.local()
+
+
+def _scratchImage(name, shape, dtype=np.uint8):
+    """Return a per-thread scratch image of the given shape.
+
+    Each name has one flat buffer per thread. It only grows, so
+    images of varying sizes (e.g. face regions) reuse it.
+    """
+    size = int(np.prod(shape))
+    buffer = getattr(_scratch, name, None)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype)
+        setattr(_scratch, name, buffer)
+    return buffer[:size].reshape(shape)
+
+
+def _reduceChannels(reduceOp, src, dst):
+    """Write a min or max over each pixel's BGR values to dst.b.
+
+    reduceOp is cv2.erode (min) or cv2.dilate (max). Viewing the
+    image as one channel, width * 3 columns wide, a 1x3 kernel
+    anchored at each blue value reduces that pixel's channels in a
+    single pass. The result goes into a per-thread scratch image.
     """
-    b, g, r = cv2.split(src)
-    cv2.addWeighted(b, 0.5, g, 0.5, 0, b)
-    cv2.merge((b, b, r), dst)
+    h, w = src.shape[:2]
+    buffer = _scratchImage('reduceBuffer', src.shape)
+    reduceOp(src.reshape(h, w * 3), _CHANNEL_KERNEL,
+             buffer.reshape(h, w * 3), anchor=(0, 0),
+             borderType=cv2.BORDER_REPLICATE)
+    if dst is not src:
+        dst[:] = src
+    cv2.mixChannels([buffer], [dst], [0, 0])
 
 
+@pointwise
 def recolorRGV(src, dst):
     """Simulate conversion from BGR to RGV (red, green, value).
     The source and destination images must both be in BGR format.
@@ -28,13 +85,13 @@ def recolorRGV(src, dst):
     dst.b = min(src.b, src.g, src.r)
     dst.g = src.g
     dst.r = src.r
+
+    The destination may be the source.
     """
-    b, g, r = cv2.split(src)
-    cv2.min(b, g, r)
-    cv2.min(b, r, b)
-    cv2.merge((b, g, r), dst)
+    _reduceChannels(cv2.erode, src, dst)
 
 
+@pointwise
 def recolorCMV(src, dst):
     """Simulate conversion from BGR to CMV (cyan, magenta, value).
     The source and destination images must both be in BGR format.
@@ -44,11 +101,61 @@ def recolorCMV(src, dst):
     dst.b = max(src.b, src.g, src.r)
     dst.g = src.g
     dst.r = src.r
+
+    The destination may be the source.
     """
-    b, g, r = cv2.split(src)
-    cv2.max(b, g, b)
-    cv2.max(b, r, b)
-    cv2.merge((b, g, r), dst)
+    _reduceChannels(cv2.dilate, src, dst)
+
+
+BATCH_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def applyBatch(filterFunc, src, dst, chunkBytes=BATCH_CHUNK_BYTES,
+               executor=None, isPointwise=None):
+    """Apply a filter to each frame of an (N, H, W[, 3]) stack.
+
+    filterFunc takes (src, dst) like the other filters, e.g.
+    recolorRC or strokeEdges. src may be a memory-mapped stack and dst
+    must be a preallocated stack of the same shape; it may be src.
+
+    The stack is processed in chunks of whole frames, about chunkBytes
+    each. If an executor (e.g. a ThreadPoolExecutor) is given, the
+    chunks are processed concurrently on it.
+
+    Pointwise filters (see pointwise(), e.g. the recolor functions and
+    the lookup filters' apply methods) filter each contiguous chunk in
+    one call, as one tall frame. isPointwise overrides whether
+    filterFunc is treated as pointwise. Either way, the output is the
+    same as filtering frame by frame.
+    """
+    if isPointwise is None:
+        isPointwise = getattr(filterFunc, 'isPointwise', False)
+    numFrames = len(src)
+    if numFrames == 0:
+        return
+    frameBytes = max(1, src[0].nbytes)
+    framesPerChunk = max(1, chunkBytes // frameBytes)
+
+    def applyChunk(start):
+        stop = min(start + framesPerChunk, numFrames)
+        srcChunk = np.asarray(src[start:stop])
+        dstChunk = np.asarray(dst[start:stop])
+        if isPointwise and srcChunk.flags.c_contiguous and \
+                dstChunk.flags.c_contiguous:
+            tallShape = (-1,) + srcChunk.shape[2:]
+            filterFunc(srcChunk.reshape(tallShape),
+                       dstChunk.reshape(tallShape))
+        else:
+            for i in range(stop - start):
+                filterFunc(srcChunk[i], dstChunk[i])
+
+    starts = range(0, numFrames, framesPerChunk)
+    if executor is None:
+        for start in starts:
+            applyChunk(start)
+    else:
+        for _ in executor.map(applyChunk, starts):
+            pass
 
 
 class VFuncFilter(object):
@@ -58,13 +165,19 @@ class VFuncFilter(object):
         length = np.iinfo(dtype).max + 1
         self._vLookupArray = utils.createLookupArray(vFunc, length)
 
+    @pointwise
     def apply(self, src, dst):
         """Apply the filter with a BGR or gray source/destination."""
-        srcFlatView = utils.flatView(src)
-        dstFlatView = utils.flatView(dst)
+        srcFlatView = utils.createFlatView(src)
+        dstFlatView = utils.createFlatView(dst)
         utils.applyLookupArray(self._vLookupArray, srcFlatView,
                                dstFlatView)
 
+    def applyBatch(self, src, dst, chunkBytes=BATCH_CHUNK_BYTES,
+                   executor=None):
+        """Apply the filter to each frame of a stack of frames."""
+        applyBatch(self.apply, src, dst, chunkBytes, executor)
+
 
 class VCurveFilter(VFuncFilter):
     """A filter that applies a curve to V (or all of BGR)."""
@@ -87,6 +200,7 @@ class BGRFuncFilter(object):
         self._rLookupArray = utils.createLookupArray(
             utils.createCompositeFunc(rFunc, vFunc), length)
 
+    @pointwise
     def apply(self, src, dst):
         """Apply the filter with a BGR source/destination."""
         b, g, r = cv2.split(src)
@@ -95,6 +209,11 @@ class BGRFuncFilter(object):
         utils.applyLookupArray(self._bLookupArray, r, r)
         cv2.merge([b, g, r], dst)
 
+    def applyBatch(self, src, dst, chunkBytes=BATCH_CHUNK_BYTES,
+                   executor=None):
+        """Apply the filter to each frame of a stack of BGR frames."""
+        applyBatch(self.apply, src, dst, chunkBytes, executor)
+
 
 class BGRCurveFilter(BGRFuncFilter):
     """A filter that applies different curves to each of BGR."""
@@ -166,6 +285,80 @@ def strokeEdges(src, dst, blurKsize=7, edgeKsize=5):
     cv2.merge(channels, dst)
 
 
+def applyToRects(filterFunc, src, dst, rectList, padding=0.1,
+                 featherSize=0, fullFrameRatio=0.6):
+    """Apply a filter only to (padded) sub-rectangles of the source.
+
+    filterFunc takes (src, dst) like the other filters and is called
+    in place on each sub-view of dst, so the cost scales with the
+    area of the rectangles rather than the frame size. Overlapping
+    rectangles are merged first so that no pixel is filtered twice.
+    If the merged rectangles cover at least fullFrameRatio of the
+    frame, the filter is applied to the whole frame instead.
+
+    If featherSize > 0, the filtered pixels are blended into the
+    unfiltered ones over a border of that many pixels.
+    """
+    if dst is not src:
+        dst[:] = src
+
+    h, w = src.shape[:2]
+    roiRects = rects.mergeRects(
+        [rects.padRect(rect, padding, (w, h)) for rect in rectList])
+    if len(roiRects) == 0:
+        return
+
+    roiArea = sum(roiW * roiH for _, _, roiW, roiH in roiRects)
+    if roiArea >= fullFrameRatio * w * h:
+        filterFunc(dst, dst)
+        return
+
+    for x, y, roiW, roiH in roiRects:
+        roi = dst[y:y + roiH, x:x + roiW]
+        if featherSize <= 0:
+            filterFunc(roi, roi)
+            continue
+        unfilteredRoi = _scratchImage('unfilteredRoi', roi.shape)
+        unfilteredRoi[:] = roi
+        filterFunc(roi, roi)
+        featherMask = _scratchImage('featherMask', (roiH, roiW),
+                                    np.float32)
+        _fillFeatherMask(
+            featherMask, featherSize,
+            _featherRamp(roiH, featherSize, y > 0, y + roiH < h),
+            _featherRamp(roiW, featherSize, x > 0, x + roiW < w))
+        inverseFeatherMask = _scratchImage('inverseFeatherMask',
+                                           (roiH, roiW), np.float32)
+        np.subtract(1.0, featherMask, out=inverseFeatherMask)
+        cv2.blendLinear(roi, unfilteredRoi, featherMask,
+                        inverseFeatherMask, dst=roi)
+
+
+def _fillFeatherMask(featherMask, featherSize, rowRamp, colRamp):
+    """Write the outer minimum of two feather ramps into featherMask.
+
+    Only the first and last featherSize rows can differ from colRamp,
+    so only those are reduced. (np.minimum.outer would allocate a
+    ufunc buffer for the broadcast.)
+    """
+    h = len(rowRamp)
+    featherMask[:] = colRamp
+    if h > 2 * featherSize:
+        edgeRows = itertools.chain(range(featherSize),
+                                   range(h - featherSize, h))
+    else:
+        edgeRows = range(h)
+    for i in edgeRows:
+        np.minimum(featherMask[i], rowRamp[i], out=featherMask[i])
+
+
+@functools.lru_cache(maxsize=256)
+def _featherRamp(length, featherSize, featherStart, featherEnd):
+    """Return a cached 1D feather ramp (see utils.createFeatherRamp)."""
+    return utils.createFeatherRamp(length, featherSize, featherStart,
+                                   featherEnd)
+
+
 class VConvolutionFilter(object):
     """A filter that applies a convolution to V (or all of BGR)."""
 
@@ -176,6 +369,11 @@ class VConvolutionFilter(object):
         """Apply the filter with a BGR or gray source/destination."""
         cv2.filter2D(src, -1, self._kernel, dst)
 
+    def applyBatch(self, src, dst, chunkBytes=BATCH_CHUNK_BYTES,
+                   executor=None):
+        """Apply the filter to each frame of a stack of frames."""
+        applyBatch(self.apply, src, dst, chunkBytes, executor)
+
 
 class SharperFilter(VConvolutionFilter):
     """A sharpen filter with a 1-pixel radius."""
@@ -1,6 +1,10 @@
+import collections
 import cv2
 import numpy as np
+import socket
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 
 class CaptureManager(object):
@@ -95,6 +99,15 @@ class CaptureManager(object):
         self._frame = None
         self._enteredFrame = False
 
+    def release(self):
+        """Stop writing video and release the capture."""
+        if self._videoWriter is not None:
+            self._videoWriter.release()
+        self.stopWritingVideo()
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
     def writeImage(self, filename):
         """Write the next exited frame to an image file"""
         self._imageFilename = filename
@@ -161,3 +174,265 @@ class WindowManager(object):
             # Discard any non-ASCII info encoded by GTK
             keycode &= 0xFF
             self.keypressCallback(keycode)
+
+
+class StreamManager(object):
+    """A headless alternative to WindowManager.
+
+    Shown frames are JPEG-encoded once, in a worker thread, and served
+    to any number of HTTP clients as a multipart/x-mixed-replace
+    (MJPEG) stream. Each client always gets the latest encoded frame,
+    so slow clients skip frames rather than fall behind.
+
+    Clients can also send keypresses, which processEvents() passes to
+    keypressCallback on the main loop's thread:
+    POST /key/<keycode> -- press a key, e.g. /key/32 for space;
+    POST /quit -- press escape.
+    Keypresses are POST-only, so that a page cannot send them just by
+    linking to them (e.g. in an <img> tag).
+    """
+
+    ESCAPE_KEYCODE = 27
+
+    def __init__(self, address=('127.0.0.1', 8080), keypressCallback=None,
+                 maxFps=30.0, jpegQuality=80, sendBufferSize=None,
+                 clientTimeout=10.0):
+        self.keypressCallback = keypressCallback
+        self.maxFps = maxFps
+        self.jpegQuality = jpegQuality
+        # A small socket send buffer keeps the OS from queueing many
+        # stale frames for a slow client. None keeps the OS default.
+        self.sendBufferSize = sendBufferSize
+        # Seconds a client may go without reading before it is
+        # disconnected. None waits forever.
+        self.clientTimeout = clientTimeout
+        self._address = address
+        self._isWindowCreated = False
+        self._server = None
+        self._serverThread = None
+        self._encoderThread = None
+
+        # The latest frame passed to show(), waiting to be encoded.
+        self._frameCondition = threading.Condition()
+        self._pendingFrame = None
+
+        # The latest encoded frame, shared by all clients.
+        self._jpegCondition = threading.Condition()
+        self._jpeg = None
+        self._jpegIndex = 0
+
+        self._framesEncoded = 0
+        self._framesDropped = 0
+        self._encodeTimeEstimate = None
+        self._numClients = 0
+
+        # Keycodes sent by clients, waiting for processEvents().
+        self._keycodes = collections.deque()
+
+    @property
+    def isWindowCreated(self):
+        return self._isWindowCreated
+
+    @property
+    def address(self):
+        """The (host, port) being served, once the stream is created."""
+        if self._server is None:
+            return self._address
+        return self._server.server_address[:2]
+
+    @property
+    def framesEncoded(self):
+        return self._framesEncoded
+
+    @property
+    def framesDropped(self):
+        """Frames replaced by a newer frame before being encoded."""
+        return self._framesDropped
+
+    @property
+    def encodeTimeEstimate(self):
+        """A moving average of the seconds spent encoding a frame."""
+        return self._encodeTimeEstimate
+
+    @property
+    def numClients(self):
+        return self._numClients
+
+    def createWindow(self):
+        """Start serving the stream."""
+        self._server = ThreadingHTTPServer(self._address,
+                                           self._makeRequestHandler())
+        self._server.daemon_threads = True
+        self._isWindowCreated = True
+        self._serverThread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._serverThread.start()
+        self._encoderThread = threading.Thread(target=self._encodeFrames,
+                                               daemon=True)
+        self._encoderThread.start()
+
+    def show(self, frame):
+        """Queue a frame to be encoded and sent to the clients.
+
+        A reference to the frame is kept until it is encoded, so the
+        caller should not modify it afterwards.
+        """
+        with self._frameCondition:
+            if self._pendingFrame is not None:
+                self._framesDropped += 1
+            self._pendingFrame = frame
+            self._frameCondition.notify()
+
+    def destroyWindow(self):
+        """Stop serving the stream and disconnect the clients."""
+        if not self._isWindowCreated:
+            return
+        self._isWindowCreated = False
+        with self._frameCondition:
+            self._frameCondition.notify_all()
+        with self._jpegCondition:
+            self._jpegCondition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._serverThread.join()
+        self._encoderThread.join()
+
+    def processEvents(self):
+        """Pass any keypresses sent by clients to the callback."""
+        while self._keycodes:
+            keycode = self._keycodes.popleft()
+            if self.keypressCallback is not None:
+                self.keypressCallback(keycode)
+
+    def _encodeFrames(self):
+        lastEncodeTime = 0.0
+        while self._isWindowCreated:
+            # Respect the frame rate cap. Frames shown meanwhile
+            # replace each other.
+            if self.maxFps:
+                delay = lastEncodeTime + 1.0 / self.maxFps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            with self._frameCondition:
+                while self._pendingFrame is None and \
+                        self._isWindowCreated:
+                    self._frameCondition.wait()
+                frame = self._pendingFrame
+                self._pendingFrame = None
+            if frame is None:
+                break
+
+            lastEncodeTime = time.time()
+            ok, jpeg = cv2.imencode(
+                '.jpg', frame,
+                [cv2.IMWRITE_JPEG_QUALITY, int(self.jpegQuality)])
+            encodeTime = time.time() - lastEncodeTime
+            if not ok:
+                continue
+
+            if self._encodeTimeEstimate is None:
+                self._encodeTimeEstimate = encodeTime
+            else:
+                self._encodeTimeEstimate = \
+                    0.9 * self._encodeTimeEstimate + 0.1 * encodeTime
+            self._framesEncoded += 1
+
+            with self._jpegCondition:
+                self._jpeg = jpeg.tobytes()
+                self._jpegIndex += 1
+                self._jpegCondition.notify_all()
+
+    def _nextJpeg(self, lastIndex):
+        """Wait for a frame newer than lastIndex.
+
+        Return the frame's index and bytes, or (lastIndex, None) if
+        the stream is stopping.
+        """
+        with self._jpegCondition:
+            while self._jpegIndex == lastIndex and \
+                    self._isWindowCreated:
+                self._jpegCondition.wait()
+            if not self._isWindowCreated:
+                return lastIndex, None
+            return self._jpegIndex, self._jpeg
+
+    def _makeRequestHandler(self):
+        manager = self
+
+        class StreamRequestHandler(BaseHTTPRequestHandler):
+
+            def setup(self):
+                if manager.sendBufferSize is not None:
+                    self.request.setsockopt(socket.SOL_SOCKET,
+                                            socket.SO_SNDBUF,
+                                            manager.sendBufferSize)
+                # The base setup() sets this as the socket's timeout,
+                # so a client that stops reading cannot block a write
+                # forever.
+                self.timeout = manager.clientTimeout
+                BaseHTTPRequestHandler.setup(self)
+
+            def _isKeyPath(self):
+                return self.path == '/quit' or \
+                    self.path.startswith('/key/')
+
+            def do_GET(self):
+                if self._isKeyPath():
+                    self.send_response(405)
+                    self.send_header('Allow', 'POST')
+                    self.end_headers()
+                else:
+                    self._sendStream()
+
+            def do_POST(self):
+                if self.path == '/quit':
+                    self._sendKeycode(StreamManager.ESCAPE_KEYCODE)
+                elif self.path.startswith('/key/'):
+                    try:
+                        keycode = int(self.path[len('/key/'):])
+                    except ValueError:
+                        self.send_error(400)
+                        return
+                    self._sendKeycode(keycode)
+                else:
+                    self.send_error(404)
+
+            def _sendKeycode(self, keycode):
+                manager._keycodes.append(keycode & 0xFF)
+                self.send_response(204)
+                self.end_headers()
+
+            def _sendStream(self):
+                self.send_response(200)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header(
+                    'Content-Type',
+                    'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                with manager._jpegCondition:
+                    manager._numClients += 1
+                try:
+                    index = 0
+                    while True:
+                        index, jpeg = manager._nextJpeg(index)
+                        if jpeg is None:
+                            break
+                        self.wfile.write(
+                            b'--frame\r\n'
+                            b'Content-Type: image/jpeg\r\n'
+                            b'Content-Length: %d\r\n\r\n' % len(jpeg))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b'\r\n')
+                except (BrokenPipeError, ConnectionResetError,
+                        socket.timeout):
+                    # The client went away or stopped reading.
+                    pass
+                finally:
+                    with manager._jpegCondition:
+                        manager._numClients -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return StreamRequestHandler
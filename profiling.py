@@ -0,0 +1,177 @@
+import contextlib
+import time
+import tracemalloc
+import numpy as np
+
+
+class StageStats(object):
+    """Allocation totals for one stage of the main loop."""
+
+    def __init__(self):
+        self.frames = 0
+        self.peakBytes = 0
+        self.maxPeakBytes = 0
+        self.netBytes = 0
+        self.retainedBlocks = 0
+        self.retainedArrayBytes = 0
+        self.seconds = 0.0
+
+    def perFrame(self, total):
+        if self.frames == 0:
+            return 0
+        return total / float(self.frames)
+
+
+class AllocationProfiler(object):
+    """An opt-in, tracemalloc-based profiler of per-stage allocations.
+
+    For each stage, per frame, it records:
+    peak bytes -- the high-water mark of memory allocated during the
+        stage, i.e. the size of its temporaries;
+    net bytes -- memory allocated during the stage and still held at
+        its end.
+    If countBlocks is True, each stage is also bracketed by
+    tracemalloc snapshots, which is much slower but adds:
+    retained blocks -- the number of allocations still held at its
+        end;
+    retained array bytes -- how much of the net bytes is NumPy array
+        data (including arrays returned by OpenCV).
+
+    Snapshots only see what is still held, so temporaries that are
+    allocated and freed within a stage show up in peak bytes but not
+    in these counts. The number of allocations made during a stage is
+    not measured. Memory that OpenCV allocates internally, outside of
+    NumPy, is not seen.
+    """
+
+    def __init__(self, countBlocks=False, tracebackLimit=1):
+        self.countBlocks = countBlocks
+        self._tracebackLimit = tracebackLimit
+        self._isProfiling = False
+        self._stats = {}
+        self._stageNames = []
+        self._framesElapsed = 0
+        self._startedTracing = False
+
+    @property
+    def isProfiling(self):
+        return self._isProfiling
+
+    @property
+    def framesElapsed(self):
+        return self._framesElapsed
+
+    @property
+    def stats(self):
+        """A dict of stage names to StageStats."""
+        return self._stats
+
+    def start(self):
+        """Start tracing allocations and clear any previous results."""
+        self._stats = {}
+        self._stageNames = []
+        self._framesElapsed = 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._tracebackLimit)
+            self._startedTracing = True
+        self._isProfiling = True
+
+    def stop(self):
+        """Stop tracing allocations. The results are kept."""
+        self._isProfiling = False
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the allocations of a block of code as a stage."""
+        if not self._isProfiling:
+            yield
+            return
+
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = StageStats()
+            self._stats[name] = stats
+            self._stageNames.append(name)
+
+        if self.countBlocks:
+            startSnapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        startBytes, _ = tracemalloc.get_traced_memory()
+        startTime = time.time()
+        try:
+            yield
+        finally:
+            stats.seconds += time.time() - startTime
+            endBytes, peakBytes = tracemalloc.get_traced_memory()
+            stats.frames += 1
+            stats.peakBytes += peakBytes - startBytes
+            stats.maxPeakBytes = max(stats.maxPeakBytes,
+                                     peakBytes - startBytes)
+            stats.netBytes += endBytes - startBytes
+            if self.countBlocks:
+                endSnapshot = tracemalloc.take_snapshot()
+                stats.retainedBlocks += self._countNewBlocks(
+                    startSnapshot, endSnapshot)
+                stats.retainedArrayBytes += self._countArrayBytes(
+                    startSnapshot, endSnapshot)
+
+    def endFrame(self):
+        """Mark the end of a frame of the main loop."""
+        if self._isProfiling:
+            self._framesElapsed += 1
+
+    def report(self):
+        """Return a table of the per-frame averages of each stage."""
+        lines = ['%d frames, mean per frame:' % self._framesElapsed,
+                 '%-12s %12s %12s %21s %16s %8s' % (
+                     'stage', 'peak bytes', 'net bytes',
+                     'retained array bytes', 'retained blocks', 'ms')]
+        for name in self._stageNames:
+            stats = self._stats[name]
+            lines.append('%-12s %12d %12d %21s %16s %8.2f' % (
+                name,
+                stats.perFrame(stats.peakBytes),
+                stats.perFrame(stats.netBytes),
+                '%d' % stats.perFrame(stats.retainedArrayBytes)
+                if self.countBlocks else '-',
+                '%.1f' % stats.perFrame(stats.retainedBlocks)
+                if self.countBlocks else '-',
+                1000.0 * stats.perFrame(stats.seconds)))
+        return '\n'.join(lines)
+
+    def exceededBudgets(self, budgets):
+        """Return messages for stages over their peak-bytes budgets.
+
+        budgets maps stage names to the largest number of bytes a
+        single frame of that stage may allocate at its peak.
+        """
+        messages = []
+        for name, maxBytes in budgets.items():
+            stats = self._stats.get(name)
+            if stats is None:
+                messages.append('%s: stage was never run' % name)
+            elif stats.maxPeakBytes > maxBytes:
+                messages.append('%s: peak of %d bytes exceeds budget of '
+                                '%d bytes' % (name, stats.maxPeakBytes,
+                                              maxBytes))
+        return messages
+
+    def _countNewBlocks(self, startSnapshot, endSnapshot):
+        # Leave out the profiler's own bookkeeping.
+        ownFilter = [tracemalloc.Filter(False, tracemalloc.__file__),
+                     tracemalloc.Filter(False, contextlib.__file__),
+                     tracemalloc.Filter(False, __file__)]
+        diffs = endSnapshot.filter_traces(ownFilter).compare_to(
+            startSnapshot.filter_traces(ownFilter), 'filename')
+        return sum(diff.count_diff for diff in diffs)
+
+    def _countArrayBytes(self, startSnapshot, endSnapshot):
+        arrayFilter = [tracemalloc.DomainFilter(
+            True, np.lib.tracemalloc_domain)]
+        diffs = endSnapshot.filter_traces(arrayFilter).compare_to(
+            startSnapshot.filter_traces(arrayFilter), 'filename')
+        return sum(diff.size_diff for diff in diffs)
+
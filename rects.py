@@ -62,3 +62,54 @@ def swapRects(src, dst, rects, masks=None,
     # Copy the temporarily stored content into the first rectangle
     copyRect(temp, dst, (0, 0, w, h), rects[0], masks[numRects - 1],
              interpolation)
+
+
+def padRect(rect, padding, imageSize):
+    """Return a rectangle grown by a padding and clipped to an image.
+
+    The padding is a fraction of the rectangle's width and height.
+    The image size is given as (width, height).
+    """
+    x, y, w, h = [int(i) for i in rect]
+    imageW, imageH = imageSize
+    padX = int(w * padding)
+    padY = int(h * padding)
+    x0 = max(0, x - padX)
+    y0 = max(0, y - padY)
+    x1 = min(imageW, x + w + padX)
+    y1 = min(imageH, y + h + padY)
+    return (x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+
+def rectsOverlap(rect0, rect1):
+    """Return if two rectangles share any area."""
+    x0, y0, w0, h0 = rect0
+    x1, y1, w1, h1 = rect1
+    return x0 < x1 + w1 and x1 < x0 + w0 and \
+        y0 < y1 + h1 and y1 < y0 + h0
+
+
+def mergeRects(rects):
+    """Return the rectangles with overlapping ones replaced by their union."""
+    merged = [tuple(int(i) for i in rect) for rect in rects
+              if rect[2] > 0 and rect[3] > 0]
+    didMerge = True
+    while didMerge:
+        didMerge = False
+        i = 0
+        while i < len(merged):
+            j = i + 1
+            while j < len(merged):
+                if rectsOverlap(merged[i], merged[j]):
+                    x0, y0, w0, h0 = merged[i]
+                    x1, y1, w1, h1 = merged.pop(j)
+                    x = min(x0, x1)
+                    y = min(y0, y1)
+                    merged[i] = (x, y,
+                                 max(x0 + w0, x1 + w1) - x,
+                                 max(y0 + h0, y1 + h1) - y)
+                    didMerge = True
+                else:
+                    j += 1
+            i += 1
+    return merged
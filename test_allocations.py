@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+import filters
+from profiling import AllocationProfiler
+
+
+# The most that one 640x480 frame of each optimized path may allocate
+# at its peak, once warmed up. This leaves room for the small Python
+# objects that wrap views and return values, but not for any
+# frame-sized or region-sized temporary.
+STEADY_STATE_BUDGETS = {
+    'recolorRC': 4096,
+    'recolorRGV': 4096,
+    'recolorCMV': 4096,
+    'sharpen': 4096,
+    'recolorRCROI': 8192,
+    'recolorRGVROIs': 8192,
+    'recolorCMVROIs': 8192,
+    'featheredROIs': 8192,
+}
+
+
+class SteadyStateAllocationTest(unittest.TestCase):
+
+    width = 640
+    height = 480
+    numFrames = 20
+
+    def setUp(self):
+        self.frames = [np.random.randint(0, 256, (self.height, self.width, 3),
+                                         np.uint8)
+                       for i in range(2)]
+        self.frame = self.frames[0].copy()
+
+    def _faceRects(self, index):
+        # Face-like rects that move and grow from frame to frame, so no
+        # two frames have rects of the same size.
+        x = self.width // 4 + index * 3
+        y = self.height // 4 + index * 2
+        size = 80 + index * 2
+        return [(x, y, size, size + index % 3),
+                (x + 200, y + 40, size + 10, size - index % 5)]
+
+    def _profile(self, stages):
+        frame = self.frame
+        # Warm up on a few larger rects than any that are profiled, so
+        # that scratch buffers are grown but the profiled frames still
+        # see rect sizes that are new.
+        for index in range(2 * self.numFrames, 2 * self.numFrames + 3):
+            for name, run in stages:
+                run(frame, index)
+
+        profiler = AllocationProfiler()
+        profiler.start()
+        try:
+            for index in range(self.numFrames):
+                frame[:] = self.frames[index % len(self.frames)]
+                for name, run in stages:
+                    with profiler.stage(name):
+                        run(frame, index)
+                profiler.endFrame()
+        finally:
+            profiler.stop()
+        return profiler
+
+    def testOptimizedPathsStayWithinBudgets(self):
+        sharperFilter = filters.SharperFilter()
+        fixedRects = self._faceRects(0)
+        stages = [
+            ('recolorRC', lambda frame, index:
+                filters.recolorRC(frame, frame)),
+            ('recolorRGV', lambda frame, index:
+                filters.recolorRGV(frame, frame)),
+            ('recolorCMV', lambda frame, index:
+                filters.recolorCMV(frame, frame)),
+            ('sharpen', lambda frame, index:
+                sharperFilter.apply(frame, frame)),
+            ('recolorRCROI', lambda frame, index:
+                filters.applyToRects(filters.recolorRC, frame, frame,
+                                     fixedRects)),
+            ('recolorRGVROIs', lambda frame, index:
+                filters.applyToRects(filters.recolorRGV, frame, frame,
+                                     self._faceRects(index))),
+            ('recolorCMVROIs', lambda frame, index:
+                filters.applyToRects(filters.recolorCMV, frame, frame,
+                                     self._faceRects(index))),
+            ('featheredROIs', lambda frame, index:
+                filters.applyToRects(filters.recolorRGV, frame, frame,
+                                     self._faceRects(index),
+                                     featherSize=8)),
+        ]
+        profiler = self._profile(stages)
+        self.assertEqual(profiler.exceededBudgets(STEADY_STATE_BUDGETS), [],
+                         profiler.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import filters
+from asyncmanagers import AsyncCaptureManager, AsyncFaceTracker, \
+    AsyncFilter, AsyncVideoWriter
+
+
+class FakeCapture(object):
+    """A capture that returns numFrames small frames, then fails."""
+
+    def __init__(self, numFrames):
+        self.numFrames = numFrames
+        self.reads = 0
+        self.isReleased = False
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            self.reads += 1
+            if self.reads > self.numFrames:
+                return False, None
+            return True, np.full((4, 6, 3), self.reads, np.uint8)
+
+    def release(self):
+        self.isReleased = True
+
+
+class AsyncCaptureManagerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def testReadsAtMostMaxInFlightAhead(self):
+        capture = FakeCapture(100)
+        async with AsyncCaptureManager(capture, maxInFlight=2) as frames:
+            for i in range(5):
+                await frames.__anext__()
+                # Give the reader every chance to run ahead.
+                await asyncio.sleep(0.05)
+                self.assertLessEqual(capture.reads - frames.framesElapsed,
+                                     2)
+        self.assertTrue(capture.isReleased)
+
+    async def testEndOfStreamIsRepeated(self):
+        capture = FakeCapture(3)
+        async with AsyncCaptureManager(capture) as frames:
+            values = [int(frame[0, 0, 0]) async for frame in frames]
+            self.assertEqual(values, [1, 2, 3])
+            for i in range(2):
+                with self.assertRaises(StopAsyncIteration):
+                    await asyncio.wait_for(frames.__anext__(), 1)
+
+    async def testCancelledConsumerStopsReading(self):
+        capture = FakeCapture(1000)
+        frames = AsyncCaptureManager(capture)
+
+        async def consume():
+            async with frames:
+                async for frame in frames:
+                    await asyncio.sleep(0.01)
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        self.assertGreater(frames.framesElapsed, 0)
+        consumer.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await consumer
+        self.assertTrue(capture.isReleased)
+        reads = capture.reads
+        await asyncio.sleep(0.1)
+        self.assertEqual(capture.reads, reads)
+        self.assertLess(reads, 1000)
+
+
+class EventLoopLagTest(unittest.IsolatedAsyncioTestCase):
+
+    tickSeconds = 0.005
+    maxLagSeconds = 0.05
+
+    async def _tick(self, lags):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.tickSeconds)
+            lags.append(time.perf_counter() - start - self.tickSeconds)
+
+    async def testFilteringAndTrackingDoNotBlockTheLoop(self):
+        frame = np.random.randint(0, 256, (480, 640, 3), np.uint8)
+        dst = np.empty_like(frame)
+        executor = ThreadPoolExecutor(2)
+        edgeFilter = AsyncFilter(filters.strokeEdges, executor)
+        faceTracker = AsyncFaceTracker(executor=executor)
+        lags = []
+        ticker = asyncio.ensure_future(self._tick(lags))
+        try:
+            for i in range(5):
+                faces, none = await asyncio.gather(
+                    faceTracker.update(frame),
+                    edgeFilter.apply(frame, dst))
+                self.assertIsInstance(faces, list)
+        finally:
+            ticker.cancel()
+            executor.shutdown()
+        self.assertGreater(len(lags), 0)
+        self.assertLess(max(lags), self.maxLagSeconds)
+
+
+class AsyncVideoWriterTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.avi')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    async def testWritesFrames(self):
+        async with AsyncVideoWriter(self.filename, 30, (64, 48)) as writer:
+            for i in range(10):
+                await writer.write(np.full((48, 64, 3), i, np.uint8))
+        self.assertEqual(writer.framesWritten, 10)
+        self.assertGreater(os.path.getsize(self.filename), 0)
+
+    async def testOpensFileLazily(self):
+        writer = AsyncVideoWriter(self.filename, 30, (64, 48))
+        self.assertFalse(os.path.exists(self.filename))
+        async with writer:
+            await writer.write(np.zeros((48, 64, 3), np.uint8))
+        self.assertEqual(writer.framesWritten, 1)
+        self.assertTrue(os.path.exists(self.filename))
+
+    async def testFailedWriteDoesNotHang(self):
+        writer = AsyncVideoWriter(self.filename, 30, (64, 48),
+                                  maxPending=2)
+        # cv2.VideoWriter.write rejects a frame of the wrong dtype.
+        badFrame = np.zeros((48, 64, 3), np.float64)
+
+        async def writeMany():
+            for i in range(10):
+                await writer.write(badFrame)
+
+        with self.assertRaises(cv2.error):
+            await asyncio.wait_for(writeMany(), 5)
+        with self.assertRaises(cv2.error):
+            await asyncio.wait_for(writer.aclose(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import filters
+import rects
+
+
+def invert(src, dst):
+    cv2.bitwise_not(src, dst)
+
+
+def pseudocodeRGV(src):
+    dst = src.copy()
+    dst[..., 0] = src.min(axis=2)
+    return dst
+
+
+def pseudocodeCMV(src):
+    dst = src.copy()
+    dst[..., 0] = src.max(axis=2)
+    return dst
+
+
+def pseudocodeRC(src):
+    dst = src.copy()
+    dst[..., 0] = dst[..., 1] = (src[..., 0].astype(np.float64) +
+                                 src[..., 1]) / 2
+    return dst
+
+
+class RecolorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = np.random.randint(0, 256, (60, 80, 3), np.uint8)
+
+    def _assertMatchesPseudocode(self, recolor, pseudocode, atol=0):
+        def check(actual, src):
+            np.testing.assert_allclose(actual, pseudocode(src), atol=atol)
+
+        dst = np.empty_like(self.frame)
+        recolor(self.frame, dst)
+        check(dst, self.frame)
+
+        inPlace = self.frame.copy()
+        recolor(inPlace, inPlace)
+        check(inPlace, self.frame)
+
+        # Non-contiguous region views, as applyToRects passes.
+        roi = (slice(10, 50), slice(15, 70))
+        src = self.frame.copy()
+        dst = np.zeros_like(self.frame)
+        recolor(src[roi], dst[roi])
+        check(dst[roi], self.frame[roi])
+        self.assertFalse(dst[:10].any() or dst[50:].any() or
+                         dst[:, :15].any() or dst[:, 70:].any())
+        np.testing.assert_array_equal(src, self.frame)
+
+        inPlace = self.frame.copy()
+        recolor(inPlace[roi], inPlace[roi])
+        check(inPlace[roi], self.frame[roi])
+        outside = np.ones(self.frame.shape[:2], bool)
+        outside[roi] = False
+        np.testing.assert_array_equal(inPlace[outside],
+                                      self.frame[outside])
+
+    def testRecolorRGV(self):
+        self._assertMatchesPseudocode(filters.recolorRGV, pseudocodeRGV)
+
+    def testRecolorCMV(self):
+        self._assertMatchesPseudocode(filters.recolorCMV, pseudocodeCMV)
+
+    def testRecolorRC(self):
+        # cv2.transform rounds each half, so allow an error of 1.
+        self._assertMatchesPseudocode(filters.recolorRC, pseudocodeRC,
+                                      atol=1)
+
+
+class ApplyToRectsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = np.random.randint(0, 256, (120, 160, 3), np.uint8)
+
+    def testFiltersOnlyPaddedRects(self):
+        dst = self.frame.copy()
+        filters.applyToRects(invert, dst, dst, [(40, 30, 20, 20)],
+                             padding=0.5)
+        x, y, w, h = rects.padRect((40, 30, 20, 20), 0.5, (160, 120))
+        expected = self.frame.copy()
+        invert(expected[y:y + h, x:x + w], expected[y:y + h, x:x + w])
+        np.testing.assert_array_equal(dst, expected)
+
+    def testOverlappingRectsAreFilteredOnce(self):
+        dst = self.frame.copy()
+        filters.applyToRects(invert, dst, dst,
+                             [(40, 30, 20, 20), (50, 40, 20, 20)],
+                             padding=0)
+        expected = self.frame.copy()
+        invert(expected[30:60, 40:70], expected[30:60, 40:70])
+        np.testing.assert_array_equal(dst, expected)
+
+    def testWithoutRectsNothingChanges(self):
+        dst = np.empty_like(self.frame)
+        filters.applyToRects(invert, self.frame, dst, [])
+        np.testing.assert_array_equal(dst, self.frame)
+
+    def testFallsBackToFullFrame(self):
+        calls = []
+
+        def recordingInvert(src, dst):
+            calls.append(src.shape)
+            invert(src, dst)
+
+        src = self.frame.copy()
+        dst = np.empty_like(src)
+        filters.applyToRects(recordingInvert, src, dst,
+                             [(10, 10, 130, 90)], padding=0,
+                             fullFrameRatio=0.6)
+        self.assertEqual(calls, [src.shape])
+        np.testing.assert_array_equal(dst, cv2.bitwise_not(self.frame))
+        np.testing.assert_array_equal(src, self.frame)
+
+    def testFeatheredBlend(self):
+        featherSize = 4
+        dst = self.frame.copy()
+        # The rect touches the left edge of the frame.
+        filters.applyToRects(invert, dst, dst, [(0, 30, 40, 40)], padding=0,
+                             featherSize=featherSize)
+        inverted = cv2.bitwise_not(self.frame)
+        # Well inside the rect, and along the frame edge, the filter
+        # applies fully.
+        np.testing.assert_array_equal(dst[40:60, 0:30],
+                                      inverted[40:60, 0:30])
+        # Outside the rect, nothing changes.
+        np.testing.assert_array_equal(dst[:30], self.frame[:30])
+        np.testing.assert_array_equal(dst[:, 40:], self.frame[:, 40:])
+        # The outermost feathered column is 1 / featherSize filtered.
+        alpha = 1.0 / featherSize
+        expected = alpha * inverted[40:60, 39] + \
+            (1.0 - alpha) * self.frame[40:60, 39]
+        np.testing.assert_allclose(dst[40:60, 39], expected, atol=1)
+
+
+class ApplyBatchTest(unittest.TestCase):
+
+    numFrames = 5
+
+    def setUp(self):
+        self.stack = np.random.randint(0, 256, (self.numFrames, 24, 32, 3),
+                                       np.uint8)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _perFrame(self, filterFunc):
+        expected = np.empty_like(self.stack)
+        for i in range(self.numFrames):
+            filterFunc(self.stack[i].copy(), expected[i])
+        return expected
+
+    def _memmap(self):
+        filename = os.path.join(self.directory, 'stack.dat')
+        stack = np.memmap(filename, np.uint8, 'w+', shape=self.stack.shape)
+        stack[:] = self.stack
+        stack.flush()
+        return np.memmap(filename, np.uint8, 'r', shape=self.stack.shape)
+
+    def _assertMatchesPerFrame(self, filterFunc, applyBatch):
+        expected = self._perFrame(filterFunc)
+        executor = ThreadPoolExecutor(2)
+        try:
+            for kwargs in ({}, {'chunkBytes': 1},
+                           {'executor': executor, 'chunkBytes': 5000}):
+                dst = np.empty_like(self.stack)
+                applyBatch(self.stack, dst, **kwargs)
+                np.testing.assert_array_equal(dst, expected)
+
+                inPlace = self.stack.copy()
+                applyBatch(inPlace, inPlace, **kwargs)
+                np.testing.assert_array_equal(inPlace, expected)
+
+                dst = np.empty_like(self.stack)
+                applyBatch(self._memmap(), dst, **kwargs)
+                np.testing.assert_array_equal(dst, expected)
+        finally:
+            executor.shutdown()
+
+    def testLookupFilters(self):
+        for curveFilter in (filters.BGRPortraCurveFilter(),
+                            filters.VCurveFilter([(0, 0), (128, 100),
+                                                  (255, 255)])):
+            self._assertMatchesPerFrame(curveFilter.apply,
+                                        curveFilter.applyBatch)
+
+    def testRecolorFilters(self):
+        for recolor in (filters.recolorRC, filters.recolorRGV,
+                        filters.recolorCMV):
+            self._assertMatchesPerFrame(
+                recolor,
+                lambda src, dst, **kwargs: filters.applyBatch(
+                    recolor, src, dst, **kwargs))
+
+    def testConvolutionFilter(self):
+        sharperFilter = filters.SharperFilter()
+        self._assertMatchesPerFrame(sharperFilter.apply,
+                                    sharperFilter.applyBatch)
+
+    def testStrokeEdges(self):
+        self._assertMatchesPerFrame(
+            filters.strokeEdges,
+            lambda src, dst, **kwargs: filters.applyBatch(
+                filters.strokeEdges, src, dst, **kwargs))
+
+    def testPointwiseFiltersRunOnTallFrames(self):
+        shapes = []
+
+        @filters.pointwise
+        def recordingRecolorRC(src, dst):
+            shapes.append(src.shape)
+            filters.recolorRC(src, dst)
+
+        dst = np.empty_like(self.stack)
+        filters.applyBatch(recordingRecolorRC, self.stack, dst)
+        self.assertEqual(shapes, [(self.numFrames * 24, 32, 3)])
+        np.testing.assert_array_equal(dst, self._perFrame(filters.recolorRC))
+
+    def testOtherFiltersRunFrameByFrame(self):
+        shapes = []
+
+        def recordingStrokeEdges(src, dst):
+            shapes.append(src.shape)
+            filters.strokeEdges(src, dst)
+
+        dst = np.empty_like(self.stack)
+        filters.applyBatch(recordingStrokeEdges, self.stack, dst)
+        self.assertEqual(shapes, [(24, 32, 3)] * self.numFrames)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import http.client
+import socket
+import threading
+import time
+import unittest
+import cv2
+import numpy as np
+from managers import StreamManager
+
+
+def readPart(response):
+    """Read one part of a multipart stream. Return its headers and body."""
+    boundary = response.readline()
+    if not boundary:
+        return None, None
+    headers = {}
+    while True:
+        line = response.readline().strip()
+        if not line:
+            break
+        key, value = line.split(b':', 1)
+        headers[key.strip().lower()] = value.strip()
+    body = response.read(int(headers[b'content-length']))
+    response.readline()
+    return headers, body
+
+
+def frameLevel(index):
+    """Return the mean gray level of the index'th test frame."""
+    return 64 + index % 16 * 8
+
+
+def frameLevelOf(jpeg):
+    """Return the mean gray level of an encoded test frame."""
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    return int(round(image.mean() / 8.0)) * 8
+
+
+class StreamManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keycodes = []
+        self.manager = StreamManager(('127.0.0.1', 0),
+                                     self.keycodes.append, maxFps=0,
+                                     sendBufferSize=4096)
+        self.manager.createWindow()
+        self._stopFeeding = threading.Event()
+        self._feeder = threading.Thread(target=self._feedFrames)
+        self._feeder.start()
+
+    def tearDown(self):
+        self._stopFeeding.set()
+        self._feeder.join()
+        self.manager.destroyWindow()
+
+    def _feedFrames(self):
+        # Noisy frames, so each JPEG is bigger than the socket buffers,
+        # whose mean gray level counts up, so clients can tell which
+        # frames they skipped.
+        noise = np.random.randint(-32, 33, (240, 320, 3))
+        index = 0
+        while not self._stopFeeding.is_set():
+            frame = (frameLevel(index) + noise).astype(np.uint8)
+            self.manager.show(frame)
+            index += 1
+            time.sleep(0.002)
+
+    def _connect(self, path='/', method='GET'):
+        host, port = self.manager.address
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        # Keep the OS from buffering many frames for the client.
+        connection.sock = socket.create_connection((host, port), 5)
+        connection.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                   4096)
+        connection.request(method, path)
+        return connection, connection.getresponse()
+
+    def testClientsGetJpegParts(self):
+        connections = [self._connect() for i in range(2)]
+        for connection, response in connections:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-Type'),
+                             'multipart/x-mixed-replace; boundary=frame')
+            headers, jpeg = readPart(response)
+            self.assertEqual(headers[b'content-type'], b'image/jpeg')
+            self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+            self.assertIsNotNone(cv2.imdecode(
+                np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR))
+            connection.close()
+
+    def testSlowClientSkipsFrames(self):
+        fastConnection, fastResponse = self._connect()
+        slowConnection, slowResponse = self._connect()
+        slowValues = []
+        for i in range(5):
+            readPart(fastResponse)
+            _, jpeg = readPart(slowResponse)
+            slowValues.append(frameLevelOf(jpeg))
+            time.sleep(0.15)
+        # Each frame's level is 8 more than the last, so a step of more
+        # than 8 means frames were skipped.
+        steps = [(b - a) % 128 for a, b in zip(slowValues, slowValues[1:])]
+        self.assertTrue(any(step > 8 for step in steps), slowValues)
+        self.assertGreater(self.manager.framesEncoded, len(slowValues))
+        self.assertIsNotNone(self.manager.encodeTimeEstimate)
+        fastConnection.close()
+        slowConnection.close()
+
+    def testDestroyWindowDisconnectsClients(self):
+        connection, response = self._connect()
+        readPart(response)
+        self._stopFeeding.set()
+        self._feeder.join()
+        self.manager.destroyWindow()
+        self.assertFalse(self.manager.isWindowCreated)
+        # Read out any buffered parts, then expect the end of the stream.
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            headers, _ = readPart(response)
+            if headers is None:
+                break
+        else:
+            self.fail('client was not disconnected')
+        connection.close()
+
+    def testKeypresses(self):
+        for path in ('/key/32', '/quit'):
+            connection, response = self._connect(path, 'POST')
+            self.assertEqual(response.status, 204)
+            connection.close()
+        self.assertEqual(self.keycodes, [])
+        self.manager.processEvents()
+        self.assertEqual(self.keycodes, [32, StreamManager.ESCAPE_KEYCODE])
+
+    def testKeypressesAreNotSentByGet(self):
+        for path in ('/key/32', '/quit'):
+            connection, response = self._connect(path)
+            self.assertEqual(response.status, 405)
+            self.assertEqual(response.getheader('Allow'), 'POST')
+            connection.close()
+        self.manager.processEvents()
+        self.assertEqual(self.keycodes, [])
+
+    def testStalledClientIsDisconnected(self):
+        self.manager.clientTimeout = 0.2
+        connection, response = self._connect()
+        readPart(response)
+        # Stop reading until the server gives up on the client.
+        deadline = time.time() + 5
+        while self.manager.numClients and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.manager.numClients, 0)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
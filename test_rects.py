@@ -0,0 +1,49 @@
+import unittest
+import rects
+
+
+class PadRectTest(unittest.TestCase):
+
+    def testPadsByFractionOfSize(self):
+        self.assertEqual(rects.padRect((100, 50, 40, 20), 0.25, (640, 480)),
+                         (90, 45, 60, 30))
+
+    def testClipsAtFrameEdges(self):
+        self.assertEqual(rects.padRect((5, 2, 40, 20), 0.5, (50, 25)),
+                         (0, 0, 50, 25))
+        self.assertEqual(rects.padRect((600, 450, 40, 30), 0.5, (640, 480)),
+                         (580, 435, 60, 45))
+
+
+class MergeRectsTest(unittest.TestCase):
+
+    def testOverlappingRectsAreMerged(self):
+        self.assertEqual(rects.mergeRects([(0, 0, 10, 10), (5, 5, 10, 10)]),
+                         [(0, 0, 15, 15)])
+
+    def testTouchingRectsAreNotMerged(self):
+        touching = [(0, 0, 10, 10), (10, 0, 10, 10), (0, 10, 10, 10)]
+        self.assertEqual(rects.mergeRects(touching), touching)
+
+    def testChainedMerges(self):
+        # a overlaps b and b overlaps c, but a does not overlap c.
+        a = (0, 0, 10, 10)
+        b = (8, 8, 10, 10)
+        c = (16, 16, 10, 10)
+        self.assertEqual(rects.mergeRects([a, c, b]), [(0, 0, 26, 26)])
+
+    def testMergedRectOverlapsAnEarlierRect(self):
+        # Merging b and c makes a rect that overlaps a, which was
+        # checked before b and c were merged.
+        a = (20, 0, 5, 5)
+        b = (0, 2, 10, 10)
+        c = (8, 2, 14, 10)
+        self.assertEqual(rects.mergeRects([a, b, c]), [(0, 0, 25, 12)])
+
+    def testEmptyRectsAreDropped(self):
+        self.assertEqual(rects.mergeRects([(0, 0, 0, 10), (5, 5, 10, 0)]),
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
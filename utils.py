@@ -59,6 +59,38 @@ def createFlatView(array):
     return flatView
 
 
+def createFeatherRamp(length, featherSize, featherStart=True,
+                      featherEnd=True):
+    """Return a 1D float32 ramp that rises over featherSize pixels.
+
+    At a feathered end the outermost pixel is 1 / featherSize, the
+    next 2 / featherSize, and so on, up to 1. Ends that are not
+    feathered stay at 1.
+    """
+    ramp = np.ones(length, np.float32)
+    positions = np.arange(1, length + 1, dtype=np.float32)
+    positions /= featherSize
+    if featherStart:
+        np.minimum(ramp, positions, out=ramp)
+    if featherEnd:
+        np.minimum(ramp, positions[::-1], out=ramp)
+    return ramp
+
+
+def createFeatherMask(w, h, featherSize, featherLeft=True, featherTop=True,
+                      featherRight=True, featherBottom=True, out=None):
+    """Return an h x w float32 mask that fades toward the edges.
+
+    Each fade is featherSize pixels wide, starting at 1 / featherSize
+    on the outermost pixel and rising to 1 (see createFeatherRamp).
+    Edges that are not feathered stay at 1. If out is given, the mask
+    is written there.
+    """
+    colRamp = createFeatherRamp(w, featherSize, featherLeft, featherRight)
+    rowRamp = createFeatherRamp(h, featherSize, featherTop, featherBottom)
+    return np.minimum.outer(rowRamp, colRamp, out=out)
+
+
 def isGray(image):
     """Return if the image has one channel per pixel."""
     return image.ndim < 3